@@ -2,10 +2,18 @@
 import argparse
 import math
 import os
-from typing import Optional, Set, Tuple, Dict, List
+import re
+from dataclasses import dataclass
+from typing import Optional, Set, Tuple, List
 
+import numpy as np
 import pandas as pd
 
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # scipy is optional: fall back to brute-force NumPy distances
+    cKDTree = None
+
 """
 This script parses a target PDB file (raw pdb),
 trims it and removes ligands so that RFantibody can run.
@@ -20,10 +28,22 @@ Additions:
 
 WATER_RESNAMES = {"HOH", "WAT", "H2O", "DOD"}
 
+# Columns read from the run_dssp.py CSV (aa and asa are optional)
+_DSSP_DTYPES = {"chain": str, "res_number": "int64", "aa": str, "rsa": "float64", "asa": "float64"}
+
+# Max number of protein x ligand pairs held in memory at once by the NumPy fallback
+_PAIR_BLOCK = 1 << 22
 
-def _safe_pad(line: str, n: int = 80) -> str:
-    line = line.rstrip("\n")
-    return line + (" " * max(0, n - len(line)))
+# Record scanners, run over the whole file buffer at once (MULTILINE: ^/$ match at each line)
+_ENDMDL_RE = re.compile(r"^ENDMDL", re.M)
+# A single scan collects every record type we use; lines are then routed by their 6-char record name
+_RECORD_RE = re.compile(r"^(?:REMARK|LINK  |ATOM  |HETATM).*$", re.M)
+
+# Fixed-width layout of an 80-column ATOM/HETATM record; viewing the padded lines through it turns every
+# field extraction into a strided view over one buffer
+_ATOM_RECORD = np.dtype([("rec", "S6"), ("serial", "S6"), ("name", "S4"), ("altloc", "S1"), ("resn", "S3"),
+                         ("_pad0", "S1"), ("chain", "S1"), ("resseq", "S4"), ("icode", "S1"), ("_pad1", "S3"),
+                         ("x", "S8"), ("y", "S8"), ("z", "S8"), ("_pad2", "S22"), ("element", "S2"), ("_pad3", "S2")])
 
 
 def _remark_line(payload: str, remark_no: int = 900) -> str:
@@ -31,33 +51,186 @@ def _remark_line(payload: str, remark_no: int = 900) -> str:
     return f"REMARK {remark_no:3d} {payload}".rstrip()
 
 
-def _parse_atom_line(line: str):
-    line = _safe_pad(line, 80)
-    rec = line[0:6]
-    if rec not in ("ATOM  ", "HETATM"):
-        return None
-    atom_name = line[12:16].strip()
-    altloc = line[16]
-    resn = line[17:20].strip()
-    chain = (line[21].strip() or " ")
-    try:
-        resseq = int(line[22:26])
-    except ValueError:
-        return None
-    icode = line[26]
+def _bulk_numeric(col: np.ndarray, dtype) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert a fixed-width bytes column to numbers in one astype. Only if some field is malformed, fall back to
+    converting field by field. Returns the values and a mask of fields that parsed.
+    """
     try:
-        x = float(line[30:38])
-        y = float(line[38:46])
-        z = float(line[46:54])
+        return col.astype(dtype), np.ones(len(col), dtype = bool)
     except ValueError:
-        return None
-    element = (line[76:78].strip() if len(line) >= 78 else "").strip()
-    return {"rec": rec, "atom_name": atom_name, "altloc": altloc, "resn": resn, "chain": chain, "resseq": resseq,
-        "icode": icode, "x": x, "y": y, "z": z, "element": element, "raw": line.rstrip("\n"), }
+        conv = int if np.issubdtype(dtype, np.integer) else float
+        out = np.zeros(len(col), dtype = dtype)
+        ok = np.zeros(len(col), dtype = bool)
+        for i, v in enumerate(col.tolist()):
+            try:
+                out[i] = conv(v)
+                ok[i] = True
+            except ValueError:
+                pass
+        return out, ok
+
+
+def _parse_atom_records(lines: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Parse ATOM/HETATM lines in bulk through the fixed-width `_ATOM_RECORD` view.
+    Returns:
+        recs: (N,) structured record array (raw byte fields)
+        resseq: (N,) int64 residue numbers
+        xyz: (N, 3) float64 coordinates
+        ok: (N,) mask of records whose residue number and coordinates parsed
+    """
+    # pad/trim every line to 80 columns (one char -> one byte) so the buffer can be viewed as records
+    buf = "".join(l.ljust(80)[:80] for l in lines).encode("ascii", "replace")
+    recs = np.frombuffer(buf, dtype = _ATOM_RECORD)
+
+    resseq, ok = _bulk_numeric(recs["resseq"], np.int64)
+    xyz = np.empty((len(recs), 3))
+    for k, axis in enumerate(("x", "y", "z")):
+        xyz[:, k], ok_axis = _bulk_numeric(recs[axis], np.float64)
+        ok &= ok_axis
+    return recs, resseq, xyz, ok
+
+
+def _is_hydrogen(recs: np.ndarray) -> np.ndarray:
+    """
+    Hydrogen mask over `_ATOM_RECORD`s: element (cols 77-78) is H, or the atom name (cols 13-16) starts with H.
+    Compares raw bytes of the fixed columns instead of stripping/upper-casing strings.
+    """
+    cols = recs.view(np.uint8).reshape(len(recs), _ATOM_RECORD.itemsize)
+    space, h, h_lower = ord(" "), ord("H"), ord("h")
+
+    el0, el1 = cols[:, 76], cols[:, 77]
+    el_is_h = (((el0 == h) | (el0 == h_lower)) & (el1 == space)) | ((el0 == space) & ((el1 == h) | (el1 == h_lower)))
+
+    name = cols[:, 12:16]
+    nonblank = name != space
+    first = nonblank.argmax(1)
+    name_is_h = nonblank.any(1) & (name[np.arange(len(name)), first] == h)
+    return el_is_h | name_is_h
+
+
+@dataclass
+class AtomSoA:
+    """
+    Struct-of-arrays view of a set of atom records (one row per atom), built once after parsing.
+    """
+    xyz: np.ndarray  # (N, 3) float64
+    chain: np.ndarray  # (N,) U1
+    resseq: np.ndarray  # (N,) int32
+    icode: np.ndarray  # (N,) U1
+    resn: np.ndarray  # (N,) U3
+    raw: List[str]
+
+    def take(self, idx: np.ndarray) -> "AtomSoA":
+        """Subset of the atoms at positions `idx`"""
+        return AtomSoA(xyz = self.xyz[idx], chain = self.chain[idx], resseq = self.resseq[idx], icode = self.icode[idx],
+                       resn = self.resn[idx], raw = [self.raw[i] for i in idx.tolist()])
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def residue_id(self, i: int) -> Tuple[str, int, str, str]:
+        """(chain, resseq, icode, resn) of atom `i`, as plain Python values"""
+        return str(self.chain[i]), int(self.resseq[i]), str(self.icode[i]), str(self.resn[i])
+
+
+def _nearest_ligand_atoms(prot_xyz: np.ndarray, lig_xyz: np.ndarray, cutoff: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Nearest ligand atom of each protein atom, within `cutoff` (inclusive).
+    Returns *squared* distances; atoms with nothing in range get inf and index len(lig_xyz) (cKDTree convention).
+    """
+    if cKDTree is not None:
+        # distance_upper_bound is strict, so nudge it up to keep the cutoff inclusive;
+        # workers=-1 splits the protein atoms across all cores
+        dists, idxs = cKDTree(lig_xyz).query(prot_xyz, k = 1, distance_upper_bound = np.nextafter(cutoff, np.inf),
+                                             workers = -1)
+        return dists * dists, idxs
+
+    # Broadcast (block, 1, 3) - (1, L, 3) over blocks of protein atoms to bound the (block, L) temporary.
+    # sqrt is monotone, so compare squared distances throughout
+    d2_min = np.empty(len(prot_xyz))
+    idxs = np.empty(len(prot_xyz), dtype = np.intp)
+    block = max(1, _PAIR_BLOCK // len(lig_xyz))
+    for s in range(0, len(prot_xyz), block):
+        d2 = ((prot_xyz[s:s + block, None, :] - lig_xyz[None, :, :]) ** 2).sum(-1)
+        idxs[s:s + block] = d2.argmin(1)
+        d2_min[s:s + block] = d2[np.arange(len(d2)), idxs[s:s + block]]
+
+    out = d2_min > cutoff * cutoff
+    d2_min[out] = np.inf
+    idxs[out] = len(lig_xyz)
+    return d2_min, idxs
+
+
+def _nearest_ligand_by_residue(prot_xyz: np.ndarray, prot_res: np.ndarray, n_res: int, lig_xyz: np.ndarray,
+                               cutoff: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    For each protein residue, find the closest ligand atom within `cutoff` (inclusive).
+    Args:
+        prot_xyz: (P, 3) protein atom coordinates
+        prot_res: (P,) residue index of each protein atom, in [0, n_res)
+        n_res: number of protein residues
+        lig_xyz: (L, 3) ligand atom coordinates
+        cutoff: distance cutoff in Å
+
+    Returns:
+        best_d2: (n_res,) min squared distance per residue (inf if nothing within cutoff)
+        best_lig: (n_res,) index of the closest ligand atom (-1 if nothing within cutoff)
+    """
+    best_d2 = np.full(n_res, np.inf)
+    best_lig = np.full(n_res, -1, dtype = np.intp)
+    if len(prot_xyz) == 0 or len(lig_xyz) == 0:
+        return best_d2, best_lig
 
+    d2, idxs = _nearest_ligand_atoms(prot_xyz, lig_xyz, cutoff)
 
-def _chain_sort_key(ch: str) -> tuple:
-    return (1, "") if ch == " " else (0, ch)
+    # Group atoms by residue (stable, so ties keep the first atom) and take the first/closest of each group
+    order = np.lexsort((d2, prot_res))
+    sorted_res = prot_res[order]
+    starts = np.flatnonzero(np.r_[True, sorted_res[1:] != sorted_res[:-1]])
+    first = order[starts]
+    hit = np.isfinite(d2[first])
+
+    best_d2[sorted_res[starts][hit]] = d2[first][hit]
+    best_lig[sorted_res[starts][hit]] = idxs[first][hit]
+    return best_d2, best_lig
+
+
+def _first_seen_groups(*columns: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Group rows by the values of `columns`, numbering groups in order of first appearance.
+    Returns:
+        group: (N,) group index of every row
+        first: (G,) first row of every group
+    """
+    if len(columns[0]) == 0:
+        return np.zeros(0, dtype = np.intp), np.zeros(0, dtype = np.intp)
+
+    _, first, inverse = np.unique(np.rec.fromarrays(columns), return_index = True, return_inverse = True)
+    seen_order = np.argsort(first)
+    rank = np.empty_like(seen_order)
+    rank[seen_order] = np.arange(len(seen_order))
+    return rank[inverse.ravel()], first[seen_order]
+
+
+def _renumber_residues(chain: np.ndarray, resseq: np.ndarray, icode: np.ndarray) -> np.ndarray:
+    """
+    New residue numbers for each atom: residues (chain, resseq, icode) are numbered from 1 within each chain,
+    in order of first appearance.
+    """
+    group, first = _first_seen_groups(chain, resseq, icode)
+
+    # Running count of residues within each chain
+    res_chain = chain[first]
+    by_chain = np.argsort(res_chain, kind = "stable")
+    sorted_chain = res_chain[by_chain]
+    pos = np.arange(len(by_chain))
+    chain_start = np.maximum.accumulate(np.where(np.r_[True, sorted_chain[1:] != sorted_chain[:-1]], pos, 0))
+
+    new_num = np.empty(len(first), dtype = np.int64)
+    new_num[by_chain] = pos - chain_start + 1
+    return new_num[group]
 
 
 def _load_dssp_csv(dssp_csv: str) -> pd.DataFrame:
@@ -65,7 +238,8 @@ def _load_dssp_csv(dssp_csv: str) -> pd.DataFrame:
     Expects the CSV format produced by run_dssp.py:
       chain, res_number, aa, ss, rsa, asa, ...
     """
-    df = pd.read_csv(dssp_csv)
+    # Only load the columns used here, with their dtypes enforced at parse time
+    df = pd.read_csv(dssp_csv, usecols = lambda c: c in _DSSP_DTYPES, dtype = _DSSP_DTYPES)
 
     # Normalise expected column names
     if "res_number" not in df.columns:
@@ -76,14 +250,10 @@ def _load_dssp_csv(dssp_csv: str) -> pd.DataFrame:
         raise ValueError(f"DSSP CSV missing required column 'rsa': {dssp_csv}")
 
     df["chain"] = df["chain"].astype(str).str.strip().replace({"": " "})
-    df["res_number"] = df["res_number"].astype(int)
-    df["rsa"] = pd.to_numeric(df["rsa"], errors = "coerce")
 
     # Optional fields
     if "aa" in df.columns:
         df["aa"] = df["aa"].astype(str).str.strip()
-    if "asa" in df.columns:
-        df["asa"] = pd.to_numeric(df["asa"], errors = "coerce")
 
     return df
 
@@ -92,96 +262,51 @@ def clean_pdb_for_rfantibody(in_path: str, out_path: str, chains: Optional[Set[s
                              ligands: Optional[Set[str]] = None,  # e.g. {"FVP","NAG"}
                              ligand_cutoff: float = 4.0, renumber: bool = True, keep_altloc: str = "A", drop_h: bool = True,
                              dssp_csv: Optional[str] = None, rsa_threshold: Optional[float] = None, ) -> None:
+    # Pass 1: keep REMARK, collect LINK, collect protein ATOM + ligand HETATM coords
+    # PDBs fit comfortably in memory: read once and let the compiled regexes scan the whole buffer in C
+    with open(in_path, "r", encoding = "utf-8", errors = "replace") as f:
+        data = f.read()
+
+    # Only the first model is kept
+    endmdl = _ENDMDL_RE.search(data)
+    if endmdl is not None:
+        data = data[:endmdl.start()]
+
     original_remarks: List[str] = []
     link_lines: List[str] = []
+    atom_lines: List[str] = []
+    route = {"REMARK": original_remarks.append, "LINK  ": link_lines.append, "ATOM  ": atom_lines.append,
+             "HETATM": atom_lines.append}
+    for line in _RECORD_RE.findall(data):
+        route[line[:6]](line)
 
-    protein_atoms: List[dict] = []
-    ligand_atoms: List[dict] = []
-
-    seen_model = False
+    recs, resseq, xyz, keep = _parse_atom_records(atom_lines)
+    atoms = AtomSoA(xyz = xyz, chain = recs["chain"].astype("U1"), resseq = resseq.astype(np.int32),
+                    icode = recs["icode"].astype("U1"), resn = np.char.strip(recs["resn"]).astype("U3"),
+                    raw = atom_lines)
 
-    # For renumbering (output only)
-    new_resseq: Dict[Tuple[str, int, str], int] = {}
-    current_new: Dict[str, int] = {}
+    # Filters, as boolean masks over all records
+    keep &= (recs["altloc"] == b" ") | (recs["altloc"] == keep_altloc.encode("ascii", "replace"))
+    if drop_h:
+        keep &= ~_is_hydrogen(recs)
 
-    def accept_altloc(altloc: str) -> bool:
-        return altloc in (" ", keep_altloc)
+    is_protein = keep & (recs["rec"] == b"ATOM  ")
+    if chains is not None:
+        is_protein &= np.isin(atoms.chain, list(chains))
 
-    def is_h(atom: dict) -> bool:
-        if atom["element"].upper() == "H":
-            return True
-        return atom["atom_name"].startswith("H")
+    is_ligand = keep & (recs["rec"] == b"HETATM") & ~np.isin(atoms.resn, list(WATER_RESNAMES))
+    if ligands is not None:
+        is_ligand &= np.isin(atoms.resn, list(ligands))
 
-    # Pass 1: keep REMARK, collect LINK, collect protein ATOM + ligand HETATM coords
-    with open(in_path, "r", encoding = "utf-8", errors = "replace") as f:
-        for raw in f:
-            rec = raw[0:6]
-
-            if rec.startswith("MODEL"):
-                if seen_model:
-                    continue
-                seen_model = True
-                continue
-
-            if rec.startswith("ENDMDL"):
-                break
-
-            if rec == "REMARK":
-                original_remarks.append(raw.rstrip("\n"))
-                continue
-
-            if rec == "LINK  ":
-                link_lines.append(raw.rstrip("\n"))
-                continue
-
-            parsed = _parse_atom_line(raw)
-            if parsed is None:
-                continue
-
-            if not accept_altloc(parsed["altloc"]):
-                continue
-
-            if drop_h and is_h(parsed):
-                continue
-
-            if parsed["rec"] == "ATOM  ":
-                if chains is not None and parsed["chain"] not in chains:
-                    continue
-                # normalise altloc to blank in raw output line
-                parsed["raw"] = parsed["raw"][:16] + " " + parsed["raw"][17:]
-                protein_atoms.append(parsed)
-
-            elif parsed["rec"] == "HETATM":
-                if parsed["resn"] in WATER_RESNAMES:
-                    continue
-                if ligands is not None and parsed["resn"] not in ligands:
-                    continue
-                ligand_atoms.append(parsed)
+    protein = atoms.take(np.flatnonzero(is_protein))
+    ligand = atoms.take(np.flatnonzero(is_ligand))
 
     # Compute per-residue min distance + which ligand residue gives that min distance
     # protein residue id: (chain, resseq, icode, resn)
     # ligand residue id:  (resn, chain, resseq, icode)
-    res_best: Dict[Tuple[str, int, str, str], Tuple[float, Tuple[str, str, int, str]]] = {}
-
-    # pre-pack ligand coords with ligand residue identity
-    lig_xyz = [(a["x"], a["y"], a["z"], (a["resn"], a["chain"], a["resseq"], a["icode"])) for a in ligand_atoms]
-
-    for a in protein_atoms:
-        rid = (a["chain"], a["resseq"], a["icode"], a["resn"])
-        best_d = res_best.get(rid, (1e9, ("", "", -1, "")))[0]
-        best_lrid = res_best.get(rid, (1e9, ("", "", -1, "")))[1]
-
-        ax, ay, az = a["x"], a["y"], a["z"]
-        for lx, ly, lz, lrid in lig_xyz:
-            dx = ax - lx
-            dy = ay - ly
-            dz = az - lz
-            d = math.sqrt(dx * dx + dy * dy + dz * dz)
-            if d < best_d:
-                best_d = d
-                best_lrid = lrid
+    prot_res, res_first = _first_seen_groups(protein.chain, protein.resseq, protein.icode, protein.resn)
 
-        res_best[rid] = (best_d, best_lrid)
+    best_d2, best_lig = _nearest_ligand_by_residue(protein.xyz, prot_res, len(res_first), ligand.xyz, ligand_cutoff)
 
     # Extra REMARKS
     extra_remarks: List[str] = []
@@ -193,23 +318,31 @@ def clean_pdb_for_rfantibody(in_path: str, out_path: str, chains: Optional[Set[s
         extra_remarks.append(_remark_line(rest.lstrip(), 900))
 
     # 2) Occlusion lines -> two REMARK lines per residue
+    # (only residues with a ligand atom in range are touched in Python)
     contact_items = []
-    for (chain, resseq, icode, resn), (d, (lresn, lchain, lresseq, licode)) in res_best.items():
-        if d <= ligand_cutoff and lresn:
-            contact_items.append(((chain, resseq, icode, resn), d, (lresn, lchain, lresseq, licode)))
-
-    # Sort by chain then residue number (then insertion code), not by distance
-    contact_items.sort(key = lambda x: (_chain_sort_key(x[0][0]), x[0][1], x[0][2], x[1],))
+    for i in np.flatnonzero(best_lig >= 0).tolist():
+        chain, resseq, icode, resn = ligand.residue_id(best_lig[i])
+        if resn:
+            contact_items.append((protein.residue_id(res_first[i]), float(best_d2[i]), (resn, chain, resseq, icode)))
+
+    # Sort by chain (blank chain last) then residue number (then insertion code), not by distance.
+    # Keys are materialised once as integer columns instead of a Python key function per item
+    if contact_items:
+        chain_ord = np.array([ord(rid[0]) for rid, _, _ in contact_items])
+        order = np.lexsort((np.array([d2 for _, d2, _ in contact_items]),
+                            np.array([ord(rid[2]) for rid, _, _ in contact_items]),
+                            np.array([rid[1] for rid, _, _ in contact_items]), chain_ord, chain_ord == ord(" ")))
+        contact_items = [contact_items[i] for i in order.tolist()]
 
     # Build a simple "occluded" set for hotspot filtering (ignore insertion code for DSSP matching)
     occluded_simple: Set[Tuple[str, int]] = set()
 
-    for (chain, resseq, icode, resn), d, (lresn, lchain, lresseq, licode) in contact_items:
+    for (chain, resseq, icode, resn), d2, (lresn, lchain, lresseq, licode) in contact_items:
         ic = icode.strip()
         lic = licode.strip()
         extra_remarks.append(_remark_line("RFANTIBODY_OCCLUDED_RES", 900))
         extra_remarks.append(
-                _remark_line(f"{resn} {chain}{resseq}{ic} min_dist={d:.2f}A {lresn} {lchain}{lresseq}{lic}", 900))
+                _remark_line(f"{resn} {chain}{resseq}{ic} min_dist={math.sqrt(d2):.2f}A {lresn} {lchain}{lresseq}{lic}", 900))
         occluded_simple.add((chain, resseq))
 
     # 3) Hotspot suggestions from DSSP (rsa > threshold AND not occluded)
@@ -233,77 +366,54 @@ def clean_pdb_for_rfantibody(in_path: str, out_path: str, chains: Optional[Set[s
         # (Occlusion is defined by this script, not by RSA.)
         ddf = ddf[ddf["rsa"].notna()]
         cand = ddf[ddf["rsa"] > float(rsa_threshold)].copy()
-        cand["is_occluded"] = cand.apply(lambda r: (r["chain"], int(r["res_number"])) in occluded_simple, axis = 1)
-        cand = cand[~cand["is_occluded"]]
-
-        # Sort by chain then residue number
-        cand = cand.sort_values(by = ["chain", "res_number"],
-                key = lambda s: s.map(lambda x: _chain_sort_key(str(x)) if s.name == "chain" else x),
-                kind = "mergesort", )
-
-        for _, r in cand.iterrows():
-            chain = str(r["chain"]).strip() or " "
-            resn_3 = str(r["aa"]).strip() if "aa" in cand.columns else ""
-            resnum = int(r["res_number"])
-            rsa = float(r["rsa"])
+        is_occluded = pd.MultiIndex.from_frame(cand[["chain", "res_number"]]).isin(list(occluded_simple))
+        cand = cand[~is_occluded]
+
+        # Sort by chain (blank chain last) then residue number, via a precomputed flag column rather than a key lambda
+        cand = (cand.assign(_blank_chain = cand["chain"].eq(" "))
+                .sort_values(by = ["_blank_chain", "chain", "res_number"], kind = "mergesort")
+                .drop(columns = "_blank_chain"))
+
+        # zip over plain column lists rather than iterrows, which boxes every row into a Series
+        n_cand = len(cand)
+        aas = cand["aa"].tolist() if "aa" in cand.columns else [""] * n_cand
+        asas = cand["asa"].tolist() if "asa" in cand.columns else [None] * n_cand
+        for chain, resnum, rsa, aa, asa in zip(cand["chain"].tolist(), cand["res_number"].tolist(),
+                                               cand["rsa"].tolist(), aas, asas):
+            chain = str(chain).strip() or " "
+            resn_3 = str(aa).strip()
 
             # Optional ASA
-            asa_str = ""
-            if "asa" in cand.columns and pd.notna(r.get("asa", None)):
-                asa_str = f" asa={float(r['asa']):.2f}"
-            else:
-                asa_str = ""
+            asa_str = f" asa={float(asa):.2f}" if pd.notna(asa) else ""
 
             extra_remarks.append(_remark_line("RFANTIBODY_HOTSPOT_RES", 900))
             if resn_3:
-                extra_remarks.append(_remark_line(f"{resn_3} {chain}{resnum} rsa={rsa:.4f}{asa_str}", 900))
+                extra_remarks.append(_remark_line(f"{resn_3} {chain}{int(resnum)} rsa={float(rsa):.4f}{asa_str}", 900))
             else:
-                extra_remarks.append(_remark_line(f"{chain}{resnum} rsa={rsa:.4f}{asa_str}", 900))
-
-    # Renumber residues in output ATOM lines if requested
-    out_atom_lines: List[str] = []
-    for a in protein_atoms:
-        line = a["raw"]
-        chain_id = (line[21].strip() or " ")
-        try:
-            resseq = int(line[22:26])
-        except ValueError:
-            continue
-        icode = line[26]
+                extra_remarks.append(_remark_line(f"{chain}{int(resnum)} rsa={float(rsa):.4f}{asa_str}", 900))
 
-        if renumber:
-            key = (chain_id, resseq, icode)
-            if key not in new_resseq:
-                current_new[chain_id] = current_new.get(chain_id, 0) + 1
-                new_resseq[key] = current_new[chain_id]
-            new_num = new_resseq[key]
-            line = line[:22] + f"{new_num:4d}" + line[26:]
-
-        out_atom_lines.append(line)
+    # Output ATOM lines in a single walk: pad to 80 columns, blank the altloc, splice in the new residue number
+    # (if renumbering) and add TER at every chain change + a final TER (END is added on write)
+    new_nums = (np.char.mod("%4d", _renumber_residues(protein.chain, protein.resseq, protein.icode)).tolist()
+                if renumber else [None] * len(protein))
+    chain_ends = np.r_[protein.chain[1:] != protein.chain[:-1], True].tolist()
 
-    # Add TER between chain changes + final TER/END
     final_atom_lines: List[str] = []
-    prev_chain = None
-    for l in out_atom_lines:
-        ch = l[21] if len(l) > 21 else " "
-        if prev_chain is None:
-            prev_chain = ch
-        elif ch != prev_chain:
+    for line, num, chain_end in zip(protein.raw, new_nums, chain_ends):
+        line = line.ljust(80)
+        final_atom_lines.append(line[:16] + " " + line[17:22] + (num or line[22:26]) + line[26:])
+        if chain_end:
             final_atom_lines.append("TER")
-            prev_chain = ch
-        final_atom_lines.append(l)
-
-    if final_atom_lines:
-        final_atom_lines.append("TER")
-
-    with open(out_path, "w", encoding = "utf-8") as f:
-        for r in original_remarks:
-            f.write(r + "\n")
-        for r in extra_remarks:
-            f.write(r + "\n")
-        for a in final_atom_lines:
-            f.write(a + "\n")
-        f.write("END\n")
+
+    # Assemble the encoded output block by block in one bytearray, then a single write
+    buf = bytearray()
+    for block in (original_remarks, extra_remarks, final_atom_lines):
+        if block:
+            buf += "\n".join(block).encode("utf-8")
+            buf += b"\n"
+    buf += b"END\n"
+    with open(out_path, "wb") as f:
+        f.write(buf)
 
 
 def parse_args() -> argparse.Namespace:
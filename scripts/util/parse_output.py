@@ -10,29 +10,46 @@ Parse RF2 (and Quiver/RF2) output PDBs to produce a single table with:
     * in PDB mode: read from trailing "SCORE key: value" lines inside each PDB
     * in QV mode: read from qvscorefile-produced .sc table and merge by ID
 
-Designed to be portable (Windows/Linux): always opens text as latin-1 with errors=replace.
+Designed to be portable (Windows/Linux): PDBs are memory-mapped and scanned as bytes (only the few captured
+fields are decoded, as latin-1); text tables are opened as latin-1 with errors=replace.
 """
 
 from __future__ import annotations
 
 import argparse
+import csv
+import json
+import mmap
+import os
 import re
 from collections import defaultdict
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
-from Bio.PDB import PDBParser
-from Bio.SeqUtils import seq1
 from joblib import Parallel, delayed
 
-LABEL_RE = re.compile(r"^REMARK\s+PDBinfo-LABEL:\s*(\d+)\s+(\S+)\s*$")
-SCORE_RE = re.compile(r"^SCORE\s+([^:]+):\s*(.+?)\s*$")
+# Leading columns of the parsed table, in the order parse_single_pdb returns them
+# ("labels_json" follows H3_end when --keep-labels-json is set)
+CORE_COLS = ["id", "vh", "t", "H1_start", "H1_end", "H2_start", "H2_end", "H3_start", "H3_end"]
 
+# Auto-generated run names: <timestamp>_fw<framework>_tg<target>_hs<hotspots> (matched on the lowercased name)
+_FN_RE = re.compile(r"_fw(?P<framework>.+?)_tg(?P<target>.+?)_hs(?P<hotspots>.+)$")
 
-def read_lines(p: Path) -> List[str]:
-    """Read file lines robustly across platforms/encodings."""
-    return p.read_text(encoding = "latin-1", errors = "replace").splitlines()
+# Three-letter -> one-letter residue codes (same table as Bio.SeqUtils.seq1, plus MSE -> M); anything else is "X".
+# Keyed by the raw bytes of the resName columns so the scanner can look residues up without decoding
+_THREE_TO_ONE: Dict[bytes, str] = {
+    k.encode(): v for k, v in {"ALA": "A", "ARG": "R", "ASN": "N", "ASP": "D", "CYS": "C", "GLN": "Q", "GLU": "E",
+                               "GLY": "G", "HIS": "H", "ILE": "I", "LEU": "L", "LYS": "K", "MET": "M", "PHE": "F",
+                               "PRO": "P", "SER": "S", "THR": "T", "TRP": "W", "TYR": "Y", "VAL": "V", "ASX": "B",
+                               "GLX": "Z", "XLE": "J", "SEC": "U", "PYL": "O", "XAA": "X", "MSE": "M"}.items()}
+
+
+def read_first_line(p: Path) -> str:
+    """Read only the first line of a text file, robustly across platforms/encodings."""
+    with p.open("r", encoding = "latin-1", errors = "replace", newline = "") as handle:
+        return handle.readline().rstrip("\r\n")
 
 
 def normalise_colname(name: str) -> str:
@@ -42,18 +59,6 @@ def normalise_colname(name: str) -> str:
     return s
 
 
-def parse_labels(lines: List[str]) -> Dict[str, List[int]]:
-    """Parse REMARK PDBinfo-LABEL residue annotations into label -> sorted residue numbers."""
-    labels: Dict[str, List[int]] = defaultdict(list)
-    for ln in lines:
-        m = LABEL_RE.match(ln)
-        if m:
-            resnum = int(m.group(1))
-            label = m.group(2)
-            labels[label].append(resnum)
-    return {k: sorted(v) for k, v in labels.items()}
-
-
 def label_range(labels: Dict[str, List[int]], label: str) -> Tuple[Any, Any]:
     """Return (min,max) for a label or (NA,NA)."""
     vals = labels.get(label)
@@ -62,60 +67,70 @@ def label_range(labels: Dict[str, List[int]], label: str) -> Tuple[Any, Any]:
     return min(vals), max(vals)
 
 
-def parse_scores_from_pdb(lines: List[str]) -> Dict[str, Any]:
-    """
-    Parse trailing SCORE lines in PDB:
-      SCORE some_key: 1.234
-    Returns dict key->value (float where possible).
-    """
-    scores: Dict[str, Any] = {}
-    for ln in lines:
-        m = SCORE_RE.match(ln)
-        if not m:
-            continue
-        key = normalise_colname(m.group(1))
-        val_s = m.group(2).strip()
-
-        if val_s.lower() == "nan":
-            val = float("nan")
-        else:
-            try:
-                val = float(val_s)
-            except ValueError:
-                val = val_s
-
-        scores[key] = val
-    return scores
+def _score_value(val_s: str) -> Any:
+    """Convert a SCORE value to float where possible ("nan" -> NaN), else keep the string."""
+    if val_s.lower() == "nan":
+        return float("nan")
+    try:
+        return float(val_s)
+    except ValueError:
+        return val_s
 
 
-def parse_sequences_from_pdb(pdb_path: Path) -> Dict[str, str]:
+def parse_pdb_all(lines: Iterable[bytes]) -> Tuple[Dict[str, List[int]], Dict[str, Any], Dict[str, str]]:
     """
-    Extract per-chain sequences from a PDB using Bio.PDB.
-    Uses first model only; skips hetero residues.
+    Single pass over raw PDB byte lines, returning (labels, scores, seqs):
+      labels: REMARK PDBinfo-LABEL annotations as label -> sorted residue numbers
+      scores: trailing "SCORE some_key: 1.234" lines as key -> value (float where possible)
+      seqs:   per-chain sequences, one residue per CA atom (altLoc blank or "A") on ATOM records, first model only
+    Cheap prefix tests pick the record type; the rare LABEL/SCORE lines are split rather than regex-matched.
     """
-    parser = PDBParser(QUIET = True)
-    with pdb_path.open("r", encoding = "latin-1", errors = "replace", newline = "") as handle:
-        structure = parser.get_structure(pdb_path.stem, handle)
-
+    labels: Dict[str, List[int]] = defaultdict(list)
+    scores: Dict[str, Any] = {}
     chain_res: Dict[str, List[Tuple[int, str, str]]] = defaultdict(list)
-    model = next(structure.get_models())
+    first_model = True
 
-    for chain in model:
-        for res in chain:
-            hetflag, resseq, icode = res.id
-            if hetflag != " ":
+    for ln in lines:
+        if ln.startswith(b"ATOM  "):
+            if not first_model or ln[12:16].strip() != b"CA" or ln[16:17] not in (b" ", b"A"):
                 continue
             try:
-                aa = seq1(res.get_resname(), custom_map = {"MSE": "M"})
-            except Exception:
-                aa = "X"
-            chain_res[chain.id].append((resseq, str(icode).strip(), aa))
+                resseq = int(ln[22:26])
+            except ValueError:
+                continue
+            resname = ln[17:20]
+            aa = _THREE_TO_ONE.get(resname) or _THREE_TO_ONE.get(resname.strip().upper(), "X")
+            chain_res[ln[21:22].decode("latin-1")].append((resseq, ln[26:27].strip().decode("latin-1"), aa))
+        elif ln.startswith(b"REMARK"):
+            # REMARK PDBinfo-LABEL: <resnum> <label>
+            rest = ln[6:].lstrip()
+            if ln[6:7].isspace() and rest.startswith(b"PDBinfo-LABEL:"):
+                parts = rest[14:].split()
+                if len(parts) == 2 and parts[0].isdigit():
+                    labels[parts[1].decode("latin-1")].append(int(parts[0]))
+        elif ln.startswith(b"SCORE"):
+            # SCORE <key>: <value>
+            key, colon, val = ln[5:].partition(b":")
+            val = val.strip()
+            if ln[5:6].isspace() and colon and key.strip() and val:
+                scores[normalise_colname(key.decode("latin-1"))] = _score_value(val.decode("latin-1"))
+        elif ln.startswith(b"ENDMDL"):
+            first_model = False
 
     seqs: Dict[str, str] = {}
     for ch, items in chain_res.items():
         items.sort(key = lambda x: (x[0], x[1]))
         seqs[ch] = "".join(aa for _, _, aa in items)
-    return seqs
+    return {k: sorted(v) for k, v in labels.items()}, scores, seqs
+
+
+def scan_pdb(p: Path) -> Tuple[Dict[str, List[int]], Dict[str, Any], Dict[str, str]]:
+    """Memory-map a PDB and run parse_pdb_all over its raw byte lines."""
+    with p.open("rb") as handle:
+        if p.stat().st_size == 0:  # mmap refuses empty files
+            return parse_pdb_all([])
+        with mmap.mmap(handle.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+            return parse_pdb_all(iter(mm.readline, b""))
 
 
 def read_scores_table(scores_path: Path, pdb_stems: List[str]) -> pd.DataFrame:
@@ -124,22 +139,33 @@ def read_scores_table(scores_path: Path, pdb_stems: List[str]) -> pd.DataFrame:
     Returns a DataFrame with 'id' plus normalised score columns.
     """
     # robust delimiter detection: tab if present, else whitespace
-    first_line = read_lines(scores_path)[0] if scores_path.exists() else ""
+    first_line = read_first_line(scores_path) if scores_path.exists() else ""
     sep = "\t" if "\t" in first_line else r"\s+"
 
-    df = pd.read_csv(scores_path, sep = sep, engine = "python")
+    # The C engine handles both a tab and the r"\s+" whitespace separator natively (no regex splitting)
+    df = pd.read_csv(scores_path, sep = sep, engine = "c")
     df.columns = [normalise_colname(c) for c in df.columns]
 
     stems_set = set(pdb_stems)
 
-    # Pick the column with the most hits against extracted PDB stems
+    # Pick the column with the most hits against extracted PDB stems.
+    # Numeric columns cannot hold a stem unless the stems themselves are numbers, so skip them outright,
+    # and stop as soon as a column matches on every row.
+    numeric_stems = any(stem.isdigit() for stem in stems_set)
     best_col: Optional[str] = None
     best_hits = -1
     for c in df.columns:
-        hits = df[c].astype(str).isin(stems_set).sum()
+        col = df[c]
+        if pd.api.types.is_numeric_dtype(col.dtype):
+            if not numeric_stems:
+                continue
+            col = col.astype(str)
+        hits = int(col.isin(stems_set).sum())
         if hits > best_hits:
             best_hits = hits
             best_col = c
+            if hits == len(df):
+                break
 
     if best_col is None or best_hits <= 0:
         best_col = df.columns[0]  # fallback
@@ -151,27 +177,22 @@ def read_scores_table(scores_path: Path, pdb_stems: List[str]) -> pd.DataFrame:
     return df
 
 
-def parse_single_pdb(pdb: Path) -> Dict[str, Any]:
+def parse_single_pdb(pdb: Path, keep_labels_json: bool = False) -> Tuple[Any, ...]:
     """
     Parses a single PDB file at a time (wrapper for parallelisation to call in parse_pdb_dir)
+    Returns the CORE_COLS values in order (plus the JSON label map if keep_labels_json),
+    followed by the dict of SCORE fields.
     """
-    lines = read_lines(pdb)
-    seqs = parse_sequences_from_pdb(pdb)
-    labels = parse_labels(lines)
-    scores = parse_scores_from_pdb(lines)
+    labels, scores, seqs = scan_pdb(pdb)
 
     h1s, h1e = label_range(labels, "H1")
     h2s, h2e = label_range(labels, "H2")
     h3s, h3e = label_range(labels, "H3")
-    # Formats the results into a dictionary to use for creating a df -> to csv
-    row: Dict[str, Any] = {"id": pdb.stem,  # identifier in RFantibody run, e.g. its ID in produced by RFantibody
-                           "vh": seqs.get("H", ""), "t": seqs.get("T", ""), "H1_start": h1s, "H1_end": h1e,
-                           "H2_start": h2s, "H2_end": h2e, "H3_start": h3s, "H3_end": h3e,
-                           # uncomment this to keep full label map too (handy for debugging)
-                           # "labels_json": json.dumps(labels),
-                           }
-    row.update(scores)
-    return row
+    # id: identifier in RFantibody run, e.g. its ID in produced by RFantibody
+    core = (pdb.stem, seqs.get("H", ""), seqs.get("T", ""), h1s, h1e, h2s, h2e, h3s, h3e)
+    if keep_labels_json:  # full label map, handy for debugging
+        return *core, json.dumps(labels), scores
+    return *core, scores
 
     # wrapper = partial(cluster_single_threshold, dist_array=dist_array, features=features, labels=labels,
     #                       encoded_labels=encoded_labels, label_encoder=label_encoder,  #  #
@@ -179,22 +200,49 @@ def parse_single_pdb(pdb: Path) -> Dict[str, Any]:
     #                       delayed(wrapper)(threshold=t) for t in tqdm(limits))
 
 
-def parse_pdb_dir(pdb_dir: Path, n_jobs: int = -1) -> pd.DataFrame:
+def parse_pdb_dir(pdb_dir: Path, n_jobs: int = -1,
+                  keep_labels_json: bool = False) -> Tuple[pd.DataFrame, List[str]]:
     """
     Parse all PDB files in a directory and return a table with:
-      id, vh, t, H1_start/end, H2_start/end, H3_start/end, plus any SCORE fields found.
+      id, vh, t, H1_start/end, H2_start/end, H3_start/end, (labels_json,) plus any SCORE fields found.
+    Also returns the sorted PDB stems, so callers don't need to glob the directory again.
     """
     pdbs = sorted(pdb_dir.glob("*.pdb"))
     if not pdbs:
         raise SystemExit(f"ERROR: No .pdb files found in: {pdb_dir}")
 
-    rows = Parallel(n_jobs = n_jobs)(delayed(parse_single_pdb)(pdb = pdb) for pdb in pdbs)
-    df = pd.DataFrame(rows)
+    # Per-file work is a file read plus a line scan, so threads avoid the fork/pickle cost of process workers;
+    # batching keeps dispatch overhead low for thousands of small PDBs
+    rows = Parallel(n_jobs = n_jobs, backend = "threading", batch_size = 32)(
+        delayed(parse_single_pdb)(pdb = pdb, keep_labels_json = keep_labels_json) for pdb in pdbs)
+
+    # Build the table column-wise: core columns first, then score columns in first-seen order,
+    # NaN-padded for PDBs that lack a given score
+    core = CORE_COLS + ["labels_json"] if keep_labels_json else CORE_COLS
+    cols: Dict[str, Any] = {c: [] for c in core}
+    text_scores = set()  # score columns holding at least one non-numeric value
+    for i, (*core_vals, scores) in enumerate(rows):
+        for c, v in zip(core, core_vals):
+            cols[c].append(v)
+        for k, v in scores.items():
+            col = cols.get(k)
+            if col is None:
+                col = cols[k] = [float("nan")] * i
+            if len(col) > i:  # a SCORE key shadowing a core column overrides it
+                col[i] = v
+            else:
+                col.append(v)
+            if isinstance(v, str):
+                text_scores.add(k)
+        for col in cols.values():
+            if len(col) == i:
+                col.append(float("nan"))
 
-    # Put core columns first; keep remaining score columns afterwards
-    core = ["id", "vh", "t", "H1_start", "H1_end", "H2_start", "H2_end", "H3_start", "H3_end"]  # , "labels_json"]
-    rest = [c for c in df.columns if c not in core]
-    return df[core + rest]
+    # Purely numeric score columns go in as float64 arrays so pandas has nothing to infer;
+    # only columns that actually saw text tokens are left for object/string inference
+    for k in cols.keys() - set(core) - text_scores:
+        cols[k] = np.asarray(cols[k], dtype = np.float64)
+    return pd.DataFrame(cols, copy = False), [pdb.stem for pdb in pdbs]
 
 
 def merge_scores(df: pd.DataFrame, scores_path: Path, pdb_stems: List[str]) -> pd.DataFrame:
@@ -207,20 +255,29 @@ def merge_scores(df: pd.DataFrame, scores_path: Path, pdb_stems: List[str]) -> p
 
     merged = df.merge(sc, on = "id", how = "left", suffixes = ("", "_sc"))
 
-    # Prefer _sc when both exist
-    for c in list(merged.columns):
-        if c.endswith("_sc"):
-            base = c[:-3]
-            if base in merged.columns:
-                merged[base] = merged[c].combine_first(merged[base])
-                merged = merged.drop(columns = [c])
-            else:
-                merged = merged.rename(columns = {c: base})
+    # Prefer _sc when both exist: resolve every overlapping pair in one batch, then drop/rename in one call each
+    suffixed = [c for c in merged.columns if c.endswith("_sc")]
+    overlap = [c[:-3] for c in suffixed if c[:-3] in merged.columns]
+    if overlap:
+        overlap_sc = [c + "_sc" for c in overlap]
+        merged[overlap] = merged[overlap_sc].set_axis(overlap, axis = 1).combine_first(merged[overlap])
+        merged = merged.drop(columns = overlap_sc)
+    return merged.rename(columns = {c: c[:-3] for c in suffixed if c[:-3] not in overlap})
 
-    return merged
+
+def write_table(df: pd.DataFrame, outfile: Path, sep: str) -> None:
+    """
+    Stream a DataFrame to a delimited text file with csv.writer (no index; missing values as empty fields,
+    like DataFrame.to_csv).
+    """
+    body = df.astype(object).where(df.notna(), "")
+    with outfile.open("w", encoding = "utf-8", newline = "") as handle:
+        writer = csv.writer(handle, delimiter = sep, lineterminator = os.linesep)
+        writer.writerow(df.columns)
+        writer.writerows(body.itertuples(index = False, name = None))
 
 
-def parse_filename(filename: str) -> Dict[str]:
+def parse_filename(filename: str) -> Dict[str, Optional[str]]:
     """
     From a provided original filename, try to parse it into used arguments (framework, target, hotspot)
         Not perfect because some runs were done using pipeline_rfantibody.sh (contains command log)
@@ -233,10 +290,9 @@ def parse_filename(filename: str) -> Dict[str]:
     # in both auto and custom job mode, the first 14 characters are the script-generated timestamp in %y%m%d_%h%m%s
     res = {'timestamp': filename[:13].replace('_', '') if filename[:13].replace('_', '').isalnum() else None}
     # If all three identifiers from the autogenerated fn are found, can parse
-    if fn.find('_fw') and fn.find('_tg') and fn.find('_hs'):
-        res['framework'] = fn.split('_fw')[1].split('_tg')[0]
-        res['target'] = fn.split('_tg')[1].split('_hs')[0]
-        res['hotspots'] = fn.split('_hs')[1]
+    m = _FN_RE.search(fn)
+    if m:
+        res.update(m.groupdict())
     # If can't find the identifiers, save the entire filename as job ID that can be retraced later
     else:
         res['job_id'] = filename
@@ -256,6 +312,8 @@ def parse_args() -> argparse.Namespace:
     p.add_argument('--target', type = str, default = None, help = "str identifier for the target")
     p.add_argument('--hotspot', type = str, default = None, help = "str identifier for the hotspots")
     p.add_argument('--n_jobs', type = int, default = -1, help = 'Parallelisation of PDB parsing (default: -1)')
+    p.add_argument('--keep-labels-json', action = 'store_true',
+                   help = 'Also write the full REMARK PDBinfo-LABEL map of each PDB as a JSON column (debugging)')
     return p.parse_args()
 
 
@@ -265,12 +323,11 @@ def main() -> None:
     if not pdb_dir.is_dir():
         raise SystemExit(f"ERROR: --pdb-dir is not a directory: {pdb_dir}")
 
-    df = parse_pdb_dir(pdb_dir, args.n_jobs)
+    df, pdb_stems = parse_pdb_dir(pdb_dir, args.n_jobs, args.keep_labels_json)
 
     if args.scores is not None:
         if not args.scores.exists():
             raise SystemExit(f"ERROR: --scores file not found: {args.scores}")
-        pdb_stems = [p.stem for p in sorted(pdb_dir.glob("*.pdb"))]
         df = merge_scores(df, args.scores, pdb_stems)
 
     args.outfile.parent.mkdir(parents = True, exist_ok = True)
@@ -281,7 +338,7 @@ def main() -> None:
     reorder = list(identifiers.keys()) + cols
     for k, v in identifiers.items():
         df[k] = v
-    df[reorder].rename(columns = {'id': 'rfab_id'}).to_csv(args.outfile, sep = ',', index = False)
+    write_table(df[reorder].rename(columns = {'id': 'rfab_id'}), args.outfile, sep)
 
 
 if __name__ == "__main__":
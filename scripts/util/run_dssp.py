@@ -1,12 +1,14 @@
 from __future__ import annotations
 
 import argparse
+import io
 import os
-from typing import Dict, Optional
+import subprocess
+from pathlib import Path
+from typing import Dict, Iterable, Optional
 
 import pandas as pd
-from Bio.PDB import PDBParser
-from Bio.PDB.DSSP import DSSP
+from joblib import Parallel, delayed
 
 if 'LIBCIFPP_DATA_DIR' not in os.environ:
     os.environ["LIBCIFPP_DATA_DIR"] = r"C:\Users\JV11_DK2\AppData\Local\anaconda3\envs\ada\share\libcifpp"
@@ -20,74 +22,123 @@ AA_MAP = {'A': 'ALA', 'C': 'CYS', 'D': 'ASP', 'E': 'GLU', 'F': 'PHE', 'G': 'GLY'
           'L': 'LEU', 'M': 'MET', 'N': 'ASN', 'P': 'PRO', 'Q': 'GLN', 'R': 'ARG', 'S': 'SER', 'T': 'THR', 'V': 'VAL',
           'W': 'TRP', 'Y': 'TYR'}
 
+# Max ASA (Å^2) used by DSSP/Bio.PDB (Sander & Rost 1994) to turn DSSP's ACC into RSA
+SANDER_MAX_ASA: Dict[str, int] = {"A": 106, "R": 248, "N": 157, "D": 163, "C": 135, "Q": 198, "E": 194, "G": 84,
+                                  "H": 184, "I": 169, "L": 164, "K": 205, "M": 188, "F": 197, "P": 136, "S": 130,
+                                  "T": 142, "W": 227, "Y": 222, "V": 142, }
+
+# Fixed columns of the classic DSSP residue table (0-based, end-exclusive)
+DSSP_COLSPECS = [(0, 5), (5, 10), (11, 12), (13, 14), (16, 17), (34, 38), (103, 109), (109, 115)]
+DSSP_NAMES = ["dssp_id", "res_number", "chain", "aa", "ss", "acc", "phi", "psi"]
+
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser()
-    p.add_argument("-i", "--input", type = str, required = True, help = "Input structure file (PDB)")
-    p.add_argument("--pdb_id", type = str, required = False)
-    p.add_argument("--model_number", type = int, default = 0)
+    inp = p.add_mutually_exclusive_group(required = True)
+    inp.add_argument("-i", "--input", type = str, help = "Input structure file (PDB)")
+    inp.add_argument("--input-dir", type = str,
+                     help = "Directory of .pdb files; each gets its own <name>_dssp.csv next to it")
     # QoL: write results
-    p.add_argument("--out_csv", type = str, default = None, help = "Write per-residue DSSP table to CSV")
+    p.add_argument("--out_csv", type = str, default = None,
+                   help = "Write per-residue DSSP table to CSV (single --input only)")
     p.add_argument('--chains', type = str, default = "", help = "Comma-separated chains to keep, e.g. A,B")
     p.add_argument("--which_dssp", type = str, default = "mkdssp", help = "Path/name of mkdssp executable")
+    p.add_argument('--n_jobs', type = int, default = -1, help = 'Parallel mkdssp runs with --input-dir (default: -1)')
     return p.parse_args()
 
 
-def do_dssp(input_path: str, pdb_id: Optional[str] = None, model_number: int = 0, which_dssp: str = "mkdssp"):
+def do_dssp(input_path: str, which_dssp: str = "mkdssp") -> pd.DataFrame:
     """
-
+    Runs mkdssp (>= 4.0) on a structure file and parses its classic DSSP output.
+    mkdssp only processes the first model of the file.
     Args:
-        input_path:
-        pdb_id:
-        model_number:
+        input_path: structure file (PDB)
+        which_dssp: path/name of the mkdssp executable
 
     Returns:
-
+        raw per-residue DSSP table (dssp_id, res_number, chain, aa, ss, acc, phi, psi), chain breaks removed
     """
-    p = PDBParser()
-    if pdb_id is None:
-        pdb_id = os.path.basename(input_path).split('.')[0]
-    structure = p.get_structure(pdb_id, input_path)
-    try:
-        model = structure[model_number]
-    except KeyError as e:
-        raise KeyError(
-                f"Model {model_number} not found in structure. Available models: {[m.id for m in structure]}") from e
+    proc = subprocess.run([which_dssp, "--output-format=dssp", input_path], capture_output = True, text = True)
+    if proc.returncode != 0 or not proc.stdout.strip():
+        raise RuntimeError(f"{which_dssp} failed on {input_path}: {proc.stderr.strip()}")
+    return read_dssp(proc.stdout)
 
-    # fix for windows run...
-
-    return DSSP(model, input_path, dssp = which_dssp)
 
+def read_dssp(text: str) -> pd.DataFrame:
+    """
+    Parses the residue table of a classic-format DSSP output with the C fixed-width reader
+    Args:
+        text: DSSP output
 
-def dssp_to_df(dssp: DSSP, chains: str = None):
+    Returns:
+        raw per-residue DSSP table (dssp_id, res_number, chain, aa, ss, acc, phi, psi), chain breaks removed
+    """
+    header = text.find("  #  RESIDUE")
+    if header < 0:
+        raise ValueError("No residue table found in DSSP output")
+    table = text[text.index("\n", header) + 1:]
+    if not table.strip():
+        return pd.DataFrame({c: [] for c in DSSP_NAMES})
+    df = pd.read_fwf(io.StringIO(table), colspecs = DSSP_COLSPECS, names = DSSP_NAMES, header = None,
+                     dtype = {"chain": str, "aa": str, "ss": str})
+    # Chain breaks ("!") have no residue number
+    df = df[df["res_number"].notna()].reset_index(drop = True)
+    # read_fwf strips blanks: a blank SS code is "-" (as in Bio.PDB), a blank chain ID stays " "
+    df["ss"] = df["ss"].fillna("-")
+    df["chain"] = df["chain"].fillna(" ")
+    return df.astype({"dssp_id": "int64", "res_number": "int64", "acc": "int64"})
+
+
+def dssp_to_df(dssp: pd.DataFrame, chains: Optional[Iterable[str]] = None):
     """
     Takes a dssp output and parses it into a dataframe
     Args:
-        dssp:
+        dssp: raw per-residue table from do_dssp
+        chains: chain IDs to keep (all chains if None)
 
     Returns:
-
+        chain, res_number, dssp_id, aa, ss, rsa, asa, phi, psi
     """
-    MAX_ASA = dssp.residue_max_acc
-    ls = [{'chain': chain_info[0], 'res_number': chain_info[1][1], 'dssp_id': res_info[0], 'aa': res_info[1],
-           'ss': res_info[2], 'rsa': res_info[3], 'asa': res_info[3] * MAX_ASA[AA_MAP[res_info[1]]],
-           # RSA = ASA/Max ASA -> ASA = RSA * MaxASA
-           'phi': res_info[4], 'psi': res_info[5]} for chain_info, res_info in dssp.property_dict.items()]
+    # DSSP writes SS-bridged cysteines as lowercase letters
+    aa = dssp["aa"].where(~dssp["aa"].str.islower(), "C")
+    max_acc = aa.map(SANDER_MAX_ASA)
+    # RSA = ASA/Max ASA (capped at 1) -> ASA = RSA * MaxASA
+    rsa = (dssp["acc"] / max_acc).clip(upper = 1.0)
+    df = pd.DataFrame({"chain": dssp["chain"], "res_number": dssp["res_number"], "dssp_id": dssp["dssp_id"],
+                       "aa": aa, "ss": dssp["ss"], "rsa": rsa, "asa": rsa * max_acc, "phi": dssp["phi"],
+                       "psi": dssp["psi"]})
     if chains is not None:
-        return pd.DataFrame(ls).query('chain in @chains')
-    else:
-        return pd.DataFrame(ls)
+        return df[df["chain"].isin(chains)]
+    return df
+
+
+def run_single_dssp(input_path: str, out_csv: Optional[str] = None, chains: Optional[Iterable[str]] = None,
+                    which_dssp: str = "mkdssp") -> str:
+    """
+    Runs DSSP on one structure file and writes its per-residue table (wrapper for parallelisation in main)
+    Returns the path of the written CSV (default: <name>_dssp.csv next to the input)
+    """
+    if out_csv is None:
+        out_csv = os.path.join(os.path.dirname(input_path), f"{os.path.basename(input_path).split('.')[0]}_dssp.csv")
+    dssp_to_df(do_dssp(input_path, which_dssp), chains).to_csv(out_csv)
+    return out_csv
 
 
 def main():
     args = parse_args()
     chains = {c.strip() for c in args.chains.split(",") if c.strip()} or None
-    dssp = do_dssp(args.input, args.pdb_id, args.model_number, args.which_dssp)
-    dssp_df = dssp_to_df(dssp, chains)
-    if args.out_csv is None:
-        args.out_csv = os.path.join(os.path.dirname(args.input),
-                                    f"{os.path.basename(args.input).split('.')[0]}_dssp.csv")
-    dssp_df.to_csv(args.out_csv)
+    if args.input is not None:
+        run_single_dssp(args.input, args.out_csv, chains, args.which_dssp)
+        return 0
+
+    if args.out_csv is not None:
+        raise SystemExit("ERROR: --out_csv only applies to a single --input; --input-dir writes one CSV per PDB")
+    pdbs = sorted(Path(args.input_dir).glob("*.pdb"))
+    if not pdbs:
+        raise SystemExit(f"ERROR: No .pdb files found in: {args.input_dir}")
+    # mkdssp runs as a subprocess outside the GIL, so threads are enough to keep several runs going at once
+    Parallel(n_jobs = args.n_jobs, backend = "threading")(
+        delayed(run_single_dssp)(str(pdb), None, chains, args.which_dssp) for pdb in pdbs)
     return 0
 
 
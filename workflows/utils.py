@@ -1,12 +1,13 @@
+from functools import lru_cache
 from pathlib import Path
 import os
 import re
 
+# runs of disallowed characters *and* underscores collapse to a single "_" in one substitution
+_UNSAFE_RUN = re.compile(r"[^A-Za-z0-9.-]+")
+
 def sanitize(s: str) -> str:
-    s = re.sub(r"[^A-Za-z0-9._-]+", "_", s)
-    s = re.sub(r"^_+|_+$", "", s)
-    s = re.sub(r"_+", "_", s)
-    return s
+    return _UNSAFE_RUN.sub("_", s).strip("_")
 
 def find_repo_root(start: Path | None = None) -> Path:
     if start is None:
@@ -47,18 +48,22 @@ def get_run_ids(config):
 def get_patch_run_ids(config):
     return sorted(config.get("patch_runs", {}).keys())
 
+@lru_cache(maxsize=None)
 def fw_raw_path(framework_id):
     return f"data/01_raw/framework/{framework_id}_chothia.pdb"
 
+@lru_cache(maxsize=None)
 def fw_hlt_path(framework_id):
     return f"data/02_intermediate/framework/{framework_id}_HLT.pdb"
 
+@lru_cache(maxsize=None)
 def tg_raw_path(target_id):
     return f"data/01_raw/target/{target_id}.pdb"
 
 def tg_raw_path_nochains(target_id, config):
     return f"data/01_raw/target/{config['targets'][target_id]['save_filename']}"
 
+@lru_cache(maxsize=None)
 def tg_processed_path(target_id):
     return f"data/02_intermediate/targets/{target_id}/target_processed.pdb"
 